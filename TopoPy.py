@@ -2,11 +2,10 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.mlab as ml
-import csv
 import tkinter
 from tkinter.filedialog import askopenfilename
 import os
+from TopoPyGUI import read_survey, interpolate_grid, relief_image, slope_aspect, cut_fill_volumes
 
 ## parameters
 
@@ -16,30 +15,24 @@ precision = 150        # Resolution de l'image finale (100, 150, 300)
 delta_l   = 20         # Difference de niveau entre 2 courbes
 scale     = 1 / 200    # Echelle desiree
 extension = 2          # Ajuste la bordure blanche entre le dessin et les axes (metres)
+method    = 'cubic'    # Methode d'interpolation ('linear', 'cubic')
+shading   = 'elevation' # Coloration: 'elevation', 'hillshade', 'slope' ou 'aspect'
+analysis  = False      # True pour sauvegarder les rasters de pente et d'exposition (.npy)
+design_l  = None       # Niveau de projet pour le calcul des volumes de deblai/remblai (None: pas de calcul)
 
 ## reading data
 
-listx  = []
-listy  = []
-listz  = []
-listid = []
-
 root = tkinter.Tk()
 csvfilename = askopenfilename()
 root.withdraw()
 
-with open(csvfilename,'r') as csvfile:
-    filereader = csv.reader(csvfile, delimiter = "\t",quotechar = " " )
-    for row in filereader:
-        listid.append(str(row[0]))
-        listx.append(float(row[1]))
-        listy.append(float(row[2]))
-        listz.append(float(row[3])) 
+# text, LAS, NumPy or TopoPy binary file
+listid, listx, listy, listz, bat = read_survey(csvfilename)
         
-xmin = min(listx)
-ymin = min(listy)
-xmax = max(listx)
-ymax = max(listy)
+xmin = np.min(listx)
+ymin = np.min(listy)
+xmax = np.max(listx)
+ymax = np.max(listy)
 
 nx = 500
 ny = 500
@@ -48,10 +41,14 @@ ny = 500
 
 xi = np.linspace(xmin, xmax, nx)
 yi = np.linspace(ymin, ymax, ny)
-zi = ml.griddata(listx, listy, listz, xi, yi)
+zi = interpolate_grid(listx, listy, listz, xi, yi, method)
 
 C = plt.contour(xi, yi, zi, delta_l, linewidths = 0.5, colors = 'k')
-plt.pcolormesh(xi, yi, zi, cmap = plt.get_cmap('rainbow'))
+if shading == 'elevation':
+    plt.pcolormesh(xi, yi, zi, cmap = plt.get_cmap('rainbow'))
+else:
+    img, cmap = relief_image(shading, xi, yi, zi)
+    plt.imshow(img, extent=(xmin,xmax,ymin,ymax), origin='lower', cmap=cmap)
 plt.clabel(C, inline=1, fontsize=10)
 
 plt.colorbar() 
@@ -77,6 +74,20 @@ if plot_ids == True:
 # plotting the figure
 plt.show()
 
+## terrain analysis on the interpolated grid
+
+cur_dir = os.path.dirname(csvfilename)
+
+if analysis == True:
+    slope, aspect = slope_aspect(xi, yi, zi)
+    np.save(cur_dir + '/slope.npy', slope)
+    np.save(cur_dir + '/aspect.npy', aspect)
+
+if design_l is not None:
+    cut, fill = cut_fill_volumes(xi, yi, zi, design_l)
+    print('cut  = ', cut, 'm3')
+    print('fill = ', fill, 'm3')
+
 ## determing the resulting scale
 
 fig = plt.gcf()
@@ -116,7 +127,6 @@ fig.set_size_inches(size_x * ratio_width, size_y * ratio_length)
 
 ## saving the scaled figure
 
-cur_dir = os.path.dirname(csvfilename)
 save_filename = cur_dir + '/epreuve_scaled.png'
 fig.savefig(save_filename, dpi=precision)
 
@@ -15,13 +15,27 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.mlab as ml
 import csv
+import gc
+import json
+import os
+import struct
+import multiprocessing
 import tkinter.messagebox
 import tkinter as tk
 import platform
+from collections import deque
+from multiprocessing import shared_memory
 from scipy.interpolate import griddata
 from scipy.spatial import ConvexHull
 from tkinter.filedialog import askopenfilename, asksaveasfilename
-from matplotlib.patches import Polygon
+from matplotlib.patches import Polygon, Rectangle
+from matplotlib.figure import Figure
+from matplotlib.contour import ContourSet
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+
+## Paper formats available for the atlas export (landscape width, height in cm)
+PAPER_SIZES = {'A3': (42.0, 29.7), 'A1': (84.1, 59.4)}
 
 ## Check if a given string represent a float
 def isFloat(s):
@@ -44,6 +58,616 @@ def frange(x, y, jump):
     else:
         return None
 
+## Reading a tab separated survey file: id, x, y, z (or the building name instead of z)
+## Returns the lists of ids, x, y, z and the dict of the buildings points
+## Raises ValueError or IndexError if the file is not valid
+def read_points(filename):
+
+    listid = []
+    listx  = []
+    listy  = []
+    listz  = []
+    bat    = dict()
+
+    with open(filename,'r') as csvfile:
+        filereader = csv.reader(csvfile, delimiter = "\t",quotechar = " ")
+        for row in filereader:
+            if isFloat(row[3]):
+                listid.append(str(row[0]))
+                listx.append(float(row[1]))
+                listy.append(float(row[2]))
+                listz.append(float(row[3]))
+            else:
+                print("Reading a batiment point!")
+                if row[3] not in bat:
+                    bat[row[3]] = list()
+                bat[row[3]].append( [float(row[1]), float(row[2])] )
+
+    return listid, listx, listy, listz, bat
+
+## Sidecar file of a binary survey (filename.json) holding the buildings points and, if any, the points ids
+def sidecar_filename(filename):
+    return filename + '.json'
+
+## Reading the sidecar of a binary survey of n points
+## Returns the ids (0 to n - 1 if not given) and the dict of the buildings points
+def read_sidecar(filename, n):
+
+    sidecar = dict()
+    if os.path.exists(sidecar_filename(filename)):
+        with open(sidecar_filename(filename), 'r') as jsonfile:
+            sidecar = json.load(jsonfile)
+
+    ids = sidecar.get('ids')
+    if ids is None:
+        ids = np.arange(n)
+    elif len(ids) != n:
+        raise ValueError('The sidecar file does not match the number of points')
+
+    return ids, sidecar.get('buildings', dict())
+
+## Writing the sidecar of a binary survey (the ids are only kept if they are not the default ones)
+def write_sidecar(filename, ids, bat):
+
+    sidecar = {'buildings': bat}
+    if not np.array_equal(np.asarray(ids), np.arange(len(ids))):
+        sidecar['ids'] = [str(i) for i in ids]
+
+    with open(sidecar_filename(filename), 'w') as jsonfile:
+        json.dump(sidecar, jsonfile)
+
+## Reading the uncompressed point records of a LAS file (versions 1.0 to 1.4)
+## The integer X, Y and Z fields are zero-copy views of the memory-mapped records
+## and are scaled to coordinates in a single vectorized pass
+def read_las(filename):
+
+    with open(filename, 'rb') as lasfile:
+        header = lasfile.read(375)
+
+    if header[0:4] != b'LASF':
+        raise ValueError('Not a LAS file')
+
+    version_minor = header[25]
+    offset        = struct.unpack_from('<I', header, 96)[0]
+    point_format  = header[104]
+    record_length = struct.unpack_from('<H', header, 105)[0]
+    n             = struct.unpack_from('<I', header, 107)[0]
+    scales        = struct.unpack_from('<3d', header, 131)
+    offsets       = struct.unpack_from('<3d', header, 155)
+    if version_minor >= 4 and n == 0:
+        n = struct.unpack_from('<Q', header, 247)[0]
+
+    # the compressed (LAZ) formats have the bit 7 or 6 of the format id set
+    if point_format >= 64:
+        raise ValueError('Compressed LAS files are not supported')
+
+    records = np.memmap(filename, mode='r', offset=offset, shape=(n,),
+                        dtype=np.dtype({'names': ['X', 'Y', 'Z'], 'formats': ['<i4', '<i4', '<i4'],
+                                        'offsets': [0, 4, 8], 'itemsize': record_length}))
+
+    x = records['X'] * scales[0] + offsets[0]
+    y = records['Y'] * scales[1] + offsets[1]
+    z = records['Z'] * scales[2] + offsets[2]
+    ids, bat = read_sidecar(filename, n)
+
+    return ids, x, y, z, bat
+
+## Reading a NumPy survey file
+## .npy: array of shape (n, 3) with the x, y, z columns or structured array with the fields x, y, z (memory-mapped)
+## .npz: arrays x, y, z and optionally id (the members of a zip archive cannot be memory-mapped, they are read)
+def read_numpy(filename):
+
+    if os.path.splitext(filename)[1].lower() == '.npz':
+        with np.load(filename) as arrays:
+            x = arrays['x']
+            y = arrays['y']
+            z = arrays['z']
+            ids, bat = read_sidecar(filename, len(z))
+            if 'id' in arrays:
+                ids = arrays['id']
+        return ids, x, y, z, bat
+
+    array = np.load(filename, mmap_mode='r')
+    if array.dtype.names is not None:
+        x = array['x']
+        y = array['y']
+        z = array['z']
+    elif array.ndim == 2 and array.shape[1] == 3:
+        x = array[:, 0]
+        y = array[:, 1]
+        z = array[:, 2]
+    else:
+        raise ValueError('The array must have the shape (n, 3) or the fields x, y, z')
+    ids, bat = read_sidecar(filename, len(z))
+
+    return ids, x, y, z, bat
+
+## Header of the TopoPy columnar binary format: the magic string followed by the number of points n (uint64),
+## then the columns x, y and z of n little-endian float64 each
+COLUMNAR_MAGIC = b'TOPOPY1\0'
+
+## Reading a TopoPy columnar binary file: the columns are zero-copy views of the memory-mapped file
+def read_columnar(filename):
+
+    with open(filename, 'rb') as binfile:
+        header = binfile.read(16)
+
+    if header[0:8] != COLUMNAR_MAGIC:
+        raise ValueError('Not a TopoPy binary file')
+    n = struct.unpack_from('<Q', header, 8)[0]
+
+    columns = np.memmap(filename, dtype='<f8', mode='r', offset=16, shape=(3, n))
+    ids, bat = read_sidecar(filename, n)
+
+    return ids, columns[0], columns[1], columns[2], bat
+
+## Writing a survey in the TopoPy columnar binary format (and its sidecar)
+## The file is written aside and then moved, so that an existing file is never left half written
+## (the caller must not overwrite a survey which is still memory-mapped)
+def write_columnar(filename, ids, x, y, z, bat):
+
+    try:
+        with open(filename + '.tmp', 'wb') as binfile:
+            binfile.write(COLUMNAR_MAGIC)
+            binfile.write(struct.pack('<Q', len(z)))
+            for column in (x, y, z):
+                np.asarray(column, dtype='<f8').tofile(binfile)
+        os.replace(filename + '.tmp', filename)
+    except:
+        if os.path.exists(filename + '.tmp'):
+            os.remove(filename + '.tmp')
+        raise
+
+    write_sidecar(filename, ids, bat)
+
+## Reading a survey file, the format being given by the extension of filename
+## (.las, .npy, .npz, .tpb or the tab separated text format otherwise)
+## Returns the ids, x, y, z of the points (lists or arrays) and the dict of the buildings points
+def read_survey(filename):
+
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.las':
+        return read_las(filename)
+    elif ext in ('.npy', '.npz'):
+        return read_numpy(filename)
+    elif ext == '.tpb':
+        return read_columnar(filename)
+    else:
+        return read_points(filename)
+
+## Interpolating the points on a regular grid of nodes xi x yi
+def interpolate_grid(x, y, z, xi, yi, method):
+    X,Y = np.meshgrid(xi,yi)
+    return griddata((x, y), z, (X, Y), method=method)
+
+## Iterating over the grid zi by blocks of at most tile_rows rows
+## Yields (r0, r1, dzdx, dzdy), the partial derivatives of the surface on the rows r0 to r1 - 1
+## Each block is extended by one row on each side so that the result is identical to the whole grid
+def surface_gradient(xi, yi, zi, tile_rows = 256):
+
+    ny = zi.shape[0]
+    for r0 in range(0, ny, tile_rows):
+        r1 = min(r0 + tile_rows, ny)
+        h0 = max(r0 - 1, 0)
+        h1 = min(r1 + 1, ny)
+        dzdy, dzdx = np.gradient(zi[h0:h1], yi[h0:h1], xi)
+        yield r0, r1, dzdx[r0 - h0:r1 - h0], dzdy[r0 - h0:r1 - h0]
+
+## Slope (degrees) and aspect (degrees clockwise from the north, direction faced by the slope) of the surface zi
+def slope_aspect(xi, yi, zi, tile_rows = 256):
+
+    slope  = np.empty(zi.shape)
+    aspect = np.empty(zi.shape)
+    for r0, r1, dzdx, dzdy in surface_gradient(xi, yi, zi, tile_rows):
+        slope[r0:r1]  = np.degrees(np.arctan(np.hypot(dzdx, dzdy)))
+        aspect[r0:r1] = np.degrees(np.arctan2(-dzdx, -dzdy)) % 360
+
+    return slope, aspect
+
+## Hillshade of the surface zi (between 0 and 1) lit from the azimuth and altitude given in degrees
+def hillshade(xi, yi, zi, azimuth = 315, altitude = 45, tile_rows = 256):
+
+    zenith = np.radians(90 - altitude)
+    azimuth = np.radians(azimuth)
+
+    shade = np.empty(zi.shape)
+    for r0, r1, dzdx, dzdy in surface_gradient(xi, yi, zi, tile_rows):
+        slope  = np.arctan(np.hypot(dzdx, dzdy))
+        aspect = np.arctan2(-dzdx, -dzdy)
+        shade[r0:r1] = np.cos(zenith) * np.cos(slope) + np.sin(zenith) * np.sin(slope) * np.cos(azimuth - aspect)
+
+    return np.clip(shade, 0, 1)
+
+## Image used to color the map: 'elevation' (zi), 'hillshade', 'slope' or 'aspect'
+## Returns the image and its color map
+def relief_image(shading, xi, yi, zi):
+
+    if shading == 'hillshade':
+        return hillshade(xi, yi, zi), 'gray'
+    elif shading == 'slope':
+        return slope_aspect(xi, yi, zi)[0], 'viridis'
+    elif shading == 'aspect':
+        return slope_aspect(xi, yi, zi)[1], 'hsv'
+    else:
+        return zi, None
+
+## Cut and fill volumes (m3) of the surface zi with respect to the reference ref
+## ref is either a level (e.g. the design level) or a surface interpolated on the same grid (e.g. another survey)
+## cut is the volume of the surface above the reference, fill the volume of the surface below it
+## The nodes outside the interpolated area (nan) are ignored
+def cut_fill_volumes(xi, yi, zi, ref, tile_rows = 256):
+
+    # area represented by each node (trapezoidal rule)
+    wx = np.gradient(xi)
+    wy = np.gradient(yi)
+    wx[[0, -1]] /= 2
+    wy[[0, -1]] /= 2
+
+    ref = np.broadcast_to(ref, zi.shape)
+    cut  = 0.0
+    fill = 0.0
+    for r0 in range(0, zi.shape[0], tile_rows):
+        r1 = min(r0 + tile_rows, zi.shape[0])
+        v  = (zi[r0:r1] - ref[r0:r1]) * wy[r0:r1, None] * wx[None, :]
+        cut  += np.nansum(np.where(v > 0, v, 0))
+        fill -= np.nansum(np.where(v < 0, v, 0))
+
+    return cut, fill
+
+## Index contour levels: one level out of every, counting from the base level base_l
+def index_levels(levels, base_l, delta_l, every):
+    return [l for l in levels if int(round((l - base_l) / delta_l)) % every == 0]
+
+## Positions of the labels along the contour lines segs (list of (n, 2) arrays of vertices) of one level
+## The lines shorter than min_length (the length of a label) are not labelled; the others get one label
+## per spacing, placed at the vertex where the line is the straightest over min_length
+def label_positions(segs, min_length, spacing):
+
+    positions = list()
+    half = min_length / 2
+    for seg in segs:
+        if len(seg) < 2:
+            continue
+
+        # curvilinear abscissa of the vertices
+        cum = np.concatenate(([0], np.cumsum(np.hypot(*np.diff(seg, axis=0).T))))
+        length = cum[-1]
+        if length < min_length:
+            continue
+
+        # straightness (chord / arc) of the line over a window of min_length centered on each vertex
+        a = np.searchsorted(cum, cum - half)
+        b = np.minimum(np.searchsorted(cum, cum + half), len(cum) - 1)
+        arc   = cum[b] - cum[a]
+        chord = np.hypot(*(seg[b] - seg[a]).T)
+        valid = (cum >= half) & (cum <= length - half) & (arc > 0)
+        straightness = np.where(valid, chord / np.where(arc > 0, arc, 1), -1)
+
+        # the straightest vertex of each stretch of the line, away from the ends of the stretch
+        # so that two labels never overlap
+        nb = max(1, int(length // spacing))
+        step = length / nb
+        stretch = np.minimum((cum / step).astype(int), nb - 1)
+        offset  = cum - stretch * step
+        valid &= (offset >= half) & (step - offset >= half)
+        for k in range(nb):
+            candidates = np.flatnonzero((stretch == k) & valid)
+            if len(candidates) > 0:
+                i = candidates[np.argmax(straightness[candidates])]
+                positions.append((seg[i, 0], seg[i, 1]))
+
+    return positions
+
+## Positions of the labels of the index contour lines label_levels of the contour set C
+## m_per_inch is the number of meters represented by one inch of the drawing
+## Returns a dict level: list of positions (the levels without label are omitted)
+def contour_label_positions(C, label_levels, fnt_size, m_per_inch):
+
+    placements = dict()
+    if len(label_levels) == 0:
+        return placements
+
+    # approximate length of the longest label (meters)
+    nb_chars   = max(len('{0:g}'.format(l)) for l in label_levels) + 2
+    min_length = 0.6 * fnt_size * nb_chars / 72 * m_per_inch
+
+    for i in np.flatnonzero(np.isin(C.levels, label_levels)):
+        positions = label_positions(C.allsegs[i], min_length, 8 * min_length)
+        if positions:
+            placements[C.levels[i]] = positions
+
+    return placements
+
+## Adding the labels at the given placements (dict level: positions) to the contour set C
+## The labels are added level by level so that matplotlib only searches the lines of that level
+def add_contour_labels(C, placements, fnt_size):
+    for lev, positions in placements.items():
+        C.clabel([lev], inline=1, fontsize=fnt_size, manual=positions)
+
+## Flattening the contour lines of the contour set C into arrays that can be shared between processes:
+## seg_vertices (the vertices of all the lines), seg_offsets (line i is seg_vertices[seg_offsets[i]:seg_offsets[i + 1]]),
+## seg_levels (the level of each line) and seg_bbox (xmin, xmax, ymin, ymax of each line)
+def flatten_contours(C):
+
+    segs = [(lev, seg) for lev, level_segs in zip(C.levels, C.allsegs) for seg in level_segs if len(seg) > 0]
+    if not segs:
+        return {'seg_vertices': np.empty((0, 2)), 'seg_offsets': np.zeros(1, dtype=np.int64),
+                'seg_levels': np.empty(0), 'seg_bbox': np.empty((0, 4))}
+
+    vertices = np.concatenate([seg for lev, seg in segs])
+    offsets  = np.concatenate(([0], np.cumsum([len(seg) for lev, seg in segs]))).astype(np.int64)
+    bbox = np.column_stack((np.minimum.reduceat(vertices[:, 0], offsets[:-1]), np.maximum.reduceat(vertices[:, 0], offsets[:-1]),
+                            np.minimum.reduceat(vertices[:, 1], offsets[:-1]), np.maximum.reduceat(vertices[:, 1], offsets[:-1])))
+
+    return {'seg_vertices': vertices, 'seg_offsets': offsets,
+            'seg_levels': np.array([lev for lev, seg in segs], dtype=float), 'seg_bbox': bbox}
+
+## Contour lines (one list of lines per level of data['levels']) of the flattened contours of data
+## crossing the extent [x0, x1] x [y0, y1]; the lines are views of the flattened vertices
+def sheet_contours(data, x0, x1, y0, y1):
+
+    bbox = data['seg_bbox']
+    keep = np.flatnonzero((bbox[:, 0] <= x1) & (bbox[:, 1] >= x0) & (bbox[:, 2] <= y1) & (bbox[:, 3] >= y0))
+    level_index = np.searchsorted(data['levels'], data['seg_levels'][keep])
+
+    allsegs = [list() for l in data['levels']]
+    offsets = data['seg_offsets']
+    for i, s in zip(level_index, keep):
+        allsegs[i].append(data['seg_vertices'][offsets[s]:offsets[s + 1]])
+
+    return allsegs
+
+## Named numpy arrays copied once in shared memory, so that worker processes can attach them without copy
+## spec describes the arrays for attach_arrays; the shared memory is released by close (or on leaving a with block)
+class SharedArrays:
+
+    def __init__(self, arrays):
+
+        self.blocks = list()
+        self.spec   = dict()
+        try:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                self.blocks.append(shm)
+                np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+                self.spec[name] = (shm.name, array.shape, array.dtype.str)
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+## Attaching the shared arrays described by spec (see SharedArrays)
+## Returns the dict of the arrays (zero-copy views) and the shared memory blocks, which must be kept while the arrays are used
+def attach_arrays(spec):
+
+    arrays = dict()
+    blocks = list()
+    for name, (shm_name, shape, dtype) in spec.items():
+        try:
+            # the creator of the shared memory is in charge of releasing it (Python >= 3.13)
+            shm = shared_memory.SharedMemory(name=shm_name, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=shm_name)
+        blocks.append(shm)
+        arrays[name] = np.ndarray(shape, dtype, buffer=shm.buf)
+
+    return arrays, blocks
+
+## Splitting the map extent into sheets of the given paper format at the desired scale (1/scale)
+## Returns a list of (number, row, column, x0, x1, y0, y1), rows starting from the top of the map
+def atlas_sheets(xlim_min, xlim_max, ylim_min, ylim_max, scale, paper, overlap):
+
+    # ground dimensions (meters) covered by one sheet
+    sheet_w = PAPER_SIZES[paper][0] / 100.0 * scale
+    sheet_h = PAPER_SIZES[paper][1] / 100.0 * scale
+    if overlap < 0 or overlap >= min(sheet_w, sheet_h):
+        raise ValueError('The overlap must be positive and smaller than a sheet')
+
+    # number of sheets needed in each direction
+    step_w = sheet_w - overlap
+    step_h = sheet_h - overlap
+    nb_col = max(1, int(np.ceil((xlim_max - xlim_min - overlap) / step_w)))
+    nb_row = max(1, int(np.ceil((ylim_max - ylim_min - overlap) / step_h)))
+
+    sheets = list()
+    for r in range(nb_row):
+        for c in range(nb_col):
+            x0 = xlim_min + c * step_w
+            y1 = ylim_max - r * step_h
+            sheets.append((len(sheets) + 1, r, c, x0, x0 + sheet_w, y1 - sheet_h, y1))
+
+    return sheets
+
+## Size in inches of a paper format
+def paper_inches(paper):
+    return PAPER_SIZES[paper][0] / 2.54, PAPER_SIZES[paper][1] / 2.54
+
+## Drawing the part of the map covered by the extent [x0, x1] x [y0, y1] on the axes ax
+## data holds the gridded surface and the points, style the drawing options of draw_map
+def draw_sheet(ax, data, style, x0, x1, y0, y1):
+
+    xi = data['xi']
+    yi = data['yi']
+    zi = data['zi']
+
+    # sub-grid covering the sheet (with one extra node on each side)
+    i0 = max(np.searchsorted(xi, x0) - 1, 0)
+    i1 = min(np.searchsorted(xi, x1) + 1, len(xi))
+    j0 = max(np.searchsorted(yi, y0) - 1, 0)
+    j1 = min(np.searchsorted(yi, y1) + 1, len(yi))
+    sub_x = xi[i0:i1]
+    sub_y = yi[j0:j1]
+    sub_z = zi[j0:j1, i0:i1]
+
+    # the limits are set first so that the labels are oriented on the final drawing
+    ax.set_xlim(x0, x1)
+    ax.set_ylim(y0, y1)
+
+    # gradient
+    if style['gradient'] == 1 and len(sub_x) > 1 and len(sub_y) > 1 and not np.all(np.isnan(sub_z)):
+        img, cmap = relief_image(style['shading'], sub_x, sub_y, sub_z)
+        ax.imshow(img, extent=(sub_x[0], sub_x[-1], sub_y[0], sub_y[-1]), origin='lower',
+                  aspect='auto', cmap=cmap, vmin=data['vmin'], vmax=data['vmax'])
+
+    # contour lines of the map crossing the sheet (index ones thicker) and labels of the index contour lines on the sheet
+    if len(data['levels']) > 0:
+        linewidths = [1.0 if l in data['index_levels'] else 0.5 for l in data['levels']]
+        C = ContourSet(ax, data['levels'], sheet_contours(data, x0, x1, y0, y1), linewidths = linewidths, colors = 'k')
+        placements = contour_label_positions(C, data['index_levels'], style['fnt_size'], (x1 - x0) / ax.figure.get_size_inches()[0])
+        for lev in placements:
+            placements[lev] = [(px, py) for px, py in placements[lev] if x0 <= px <= x1 and y0 <= py <= y1]
+        add_contour_labels(C, placements, style['fnt_size'])
+
+    # data points lying on the sheet
+    x = data['x']
+    y = data['y']
+    inside = np.flatnonzero((x >= x0) & (x <= x1) & (y >= y0) & (y <= y1))
+    ax.scatter(x[inside], y[inside], marker = 'o', c = 'b', s = 5, zorder = 10)
+
+    # buildings (polygons outside the sheet are clipped by the axes)
+    for list_coord in data['polygons']:
+        ax.add_patch(Polygon(list_coord, closed = True, fill= False, hatch='///'))
+
+    # points id
+    if style['plot_ids'] == 1:
+        for i in inside:
+            ax.annotate('PN {0}'.format(data['ids'][i]), xy = (x[i], y[i]), xytext = (-1, 1), textcoords = 'offset points', ha = 'right', va = 'bottom', size = style['fnt_size'])
+
+## Arrays shared by the atlas workers
+ATLAS_SHARED = ('xi', 'yi', 'zi', 'x', 'y', 'ids', 'seg_vertices', 'seg_offsets', 'seg_levels', 'seg_bbox')
+
+## Data of the atlas workers, set once per process by atlas_init, and the shared memory blocks they use
+_atlas_data   = dict()
+_atlas_blocks = list()
+
+## Initializer of the atlas worker processes: attaching the shared arrays, the other (small) data are copied
+def atlas_init(spec, data):
+    arrays, blocks = attach_arrays(spec)
+    _atlas_blocks.extend(blocks)
+    _atlas_data.update(data)
+    _atlas_data.update(arrays)
+
+## Drawing one atlas sheet of the map data on a new figure of the paper format
+def sheet_figure(data, style, sheet, paper, dpi, nb_sheets):
+
+    num, r, c, x0, x1, y0, y1 = sheet
+
+    # the axes fill the whole sheet so that the scale is exact
+    fig = Figure(figsize=paper_inches(paper), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.tick_params(direction='in', pad=-15, labelsize=style['fnt_size'])
+    draw_sheet(ax, data, style, x0, x1, y0, y1)
+    ax.text(0.99, 0.99, '{0} / {1}'.format(num, nb_sheets), transform=ax.transAxes, ha='right', va='top',
+            size=2 * style['fnt_size'], bbox=dict(facecolor='w'), zorder=20)
+
+    return fig
+
+## Rendering one atlas sheet in a worker process and saving it in filename
+## Only the filename goes back to the main process
+def render_sheet(job):
+
+    sheet, paper, dpi, style, nb_sheets, filename = job
+    sheet_figure(_atlas_data, style, sheet, paper, dpi, nb_sheets).savefig(filename, dpi=dpi)
+
+    return filename
+
+## Drawing the index sheet: the whole map with the extent and the number of every sheet
+def render_index(data, style, sheets, paper):
+
+    fig = Figure(figsize=paper_inches(paper))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+
+    if style['gradient'] == 1:
+        img, cmap = relief_image(style['shading'], data['xi'], data['yi'], data['zi'])
+        ax.imshow(img, extent=(data['xi'][0], data['xi'][-1], data['yi'][0], data['yi'][-1]), origin='lower',
+                  cmap=cmap, vmin=data['vmin'], vmax=data['vmax'])
+    ax.scatter(data['x'], data['y'], marker = 'o', c = 'b', s = 1, zorder = 10)
+    for list_coord in data['polygons']:
+        ax.add_patch(Polygon(list_coord, closed = True, fill= False, hatch='///'))
+
+    for num, r, c, x0, x1, y0, y1 in sheets:
+        ax.add_patch(Rectangle((x0, y0), x1 - x0, y1 - y0, fill = False, edgecolor = 'r', zorder = 15))
+        ax.text((x0 + x1) / 2, (y0 + y1) / 2, str(num), color = 'r', ha = 'center', va = 'center', size = 20, zorder = 15)
+
+    ax.set_aspect('equal')
+    ax.set_xlim(min(s[3] for s in sheets), max(s[4] for s in sheets))
+    ax.set_ylim(min(s[5] for s in sheets), max(s[6] for s in sheets))
+
+    return fig
+
+## Rendering the index sheet and saving it in filename
+## The figure and its renderer (a full page of pixels) are freed before returning
+def save_index(filename, data, style, sheets, paper, dpi):
+
+    render_index(data, style, sheets, paper).savefig(filename, dpi=dpi)
+    # the figure and its canvas reference each other, only the cycle collector frees them
+    gc.collect()
+
+## Running the jobs on the pool, keeping at most window of them in progress; results are yielded in order
+def bounded_imap(pool, func, jobs, window):
+
+    pending = deque()
+    for job in jobs:
+        pending.append(pool.apply_async(func, (job,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+## Exporting the map as an atlas of sheets at the desired scale (1/scale)
+## A .pdf filename gives a multi-page vector pdf file (index first), rendered page by page in this process
+## since a pdf file cannot be written by several processes. Otherwise one file per sheet is written
+## (filename_index.ext, filename_01.ext, ...) by processes workers in parallel.
+def export_atlas(filename, data, style, scale, paper, overlap, dpi, processes = None):
+
+    sheets = atlas_sheets(data['xlim_min'], data['xlim_max'], data['ylim_min'], data['ylim_max'], scale, paper, overlap)
+    print('INFO: atlas of', len(sheets), 'sheet(s)')
+
+    root, ext = os.path.splitext(filename)
+
+    # multi-page pdf: one sheet in memory at a time, on a single core
+    if ext.lower() == '.pdf':
+        print('INFO: the pages of a pdf atlas are rendered one after the other on a single core')
+        with PdfPages(filename) as pdf:
+            pdf.savefig(render_index(data, style, sheets, paper))
+            for sheet in sheets:
+                pdf.savefig(sheet_figure(data, style, sheet, paper, dpi, len(sheets)), dpi=dpi)
+                gc.collect()
+        return sheets
+
+    save_index('{0}_index{1}'.format(root, ext), data, style, sheets, paper, dpi)
+
+    if processes is None:
+        processes = min(len(sheets), multiprocessing.cpu_count())
+
+    jobs = list()
+    for sheet in sheets:
+        jobs.append((sheet, paper, dpi, style, len(sheets), '{0}_{1:02d}{2}'.format(root, sheet[0], ext)))
+
+    # the grid, the points and the contour lines are put once in shared memory for all the workers
+    shared = SharedArrays({name: data[name] for name in ATLAS_SHARED})
+    small  = {k: v for k, v in data.items() if k not in ATLAS_SHARED}
+
+    with shared, multiprocessing.Pool(processes, initializer=atlas_init, initargs=(shared.spec, small)) as pool:
+        for sheet_filename in bounded_imap(pool, render_sheet, jobs, processes):
+            print('INFO: saved', sheet_filename)
+
+    return sheets
+
 ## AppTopoGui class - main class of the application
 class AppTopoGui(tk.Frame):
     
@@ -66,6 +690,11 @@ class AppTopoGui(tk.Frame):
         
         self.bat  = dict()          # dict containing the list of the buildings points
         
+        self.grid_cache = dict()    # last interpolated grid of the loaded data, by (nx, ny, method)
+        self.label_cache = dict()   # last positions of the contour labels, by grid and labelling parameters
+        self.map_data  = None       # gridded surface and geometry of the last drawn map
+        self.map_style = None       # drawing options of the last drawn map
+        
         self.read_settings()        # reading the settings        
         self.read_trad()            # reading the traductions
         self.initialize_menu()      # initialize the menu interface
@@ -134,6 +763,7 @@ class AppTopoGui(tk.Frame):
         
         # defining the labels of the interface
         self.loadButtonLabelTxt         = tk.StringVar()
+        self.saveDataButtonLabelTxt     = tk.StringVar()
         self.scaleLabelTxt              = tk.StringVar()
         self.dpiLabelTxt                = tk.StringVar()
         self.plotIdsLabelTxt            = tk.StringVar()
@@ -142,6 +772,7 @@ class AppTopoGui(tk.Frame):
         self.fontLabelTxt               = tk.StringVar()
         self.base_lLabelTxt             = tk.StringVar()
         self.delta_lLabelTxt            = tk.StringVar()
+        self.index_everyLabelTxt        = tk.StringVar()
         self.extensionLabelTxt          = tk.StringVar()
         self.nxnyLabelTxt               = tk.StringVar()
         self.interpMethodLabelTxt       = tk.StringVar()
@@ -151,8 +782,21 @@ class AppTopoGui(tk.Frame):
         self.userLabelTxt               = tk.StringVar()
         self.convexHullLabelTxt         = tk.StringVar()
         self.gradientLabelTxt           = tk.StringVar()
+        self.shadingLabelTxt            = tk.StringVar()
+        self.elevationLabelTxt          = tk.StringVar()
+        self.hillshadeLabelTxt          = tk.StringVar()
+        self.slopeLabelTxt              = tk.StringVar()
+        self.aspectLabelTxt             = tk.StringVar()
+        self.paperLabelTxt              = tk.StringVar()
+        self.overlapLabelTxt            = tk.StringVar()
         self.drawButtonLabelTxt         = tk.StringVar()
         self.saveButtonLabelTxt         = tk.StringVar()
+        self.atlasButtonLabelTxt        = tk.StringVar()
+        self.volumeButtonLabelTxt       = tk.StringVar()
+        self.volumeSurveyTxt            = tk.StringVar()
+        self.volumeSurveyTitleTxt       = tk.StringVar()
+        self.volumeResultTxt            = tk.StringVar()
+        self.volumeResultTitleTxt       = tk.StringVar()
         self.quitButtonLabelTxt         = tk.StringVar()
         self.languageTxt                = tk.StringVar()
         
@@ -167,6 +811,14 @@ class AppTopoGui(tk.Frame):
         self.err_draw_no_data_title = tk.StringVar()
         self.err_input_file         = tk.StringVar()
         self.err_input_file_title   = tk.StringVar()
+        self.err_atlas              = tk.StringVar()
+        self.err_atlas_title        = tk.StringVar()
+        self.err_volume_no_map       = tk.StringVar()
+        self.err_volume_no_map_title = tk.StringVar()
+        self.err_save_data           = tk.StringVar()
+        self.err_save_data_title     = tk.StringVar()
+        self.err_save_data_open      = tk.StringVar()
+        self.err_save_data_open_title = tk.StringVar()
 
     ## loading the desired langage and updating the gui accordingly
     def load_trad_gui(self, *argv):
@@ -177,6 +829,7 @@ class AppTopoGui(tk.Frame):
         
         # setting the values
         self.loadButtonLabelTxt.set(self.traductions['load'][lang])
+        self.saveDataButtonLabelTxt.set(self.traductions['saveData'][lang])
         self.scaleLabelTxt.set(self.traductions['scale'][lang])
         self.dpiLabelTxt.set(self.traductions['dpi'][lang] + '  ')
         self.plotIdsLabelTxt.set(self.traductions['plotIds'][lang] + '  ')
@@ -185,6 +838,7 @@ class AppTopoGui(tk.Frame):
         self.fontLabelTxt.set(self.traductions['font'][lang] + '  ')
         self.base_lLabelTxt.set(self.traductions['base_l'][lang] + '  ')
         self.delta_lLabelTxt.set(self.traductions['delta_l'][lang] + '  ')
+        self.index_everyLabelTxt.set(self.traductions['index_every'][lang] + '  ')
         self.extensionLabelTxt.set(self.traductions['extension'][lang] + '  ')
         self.nxnyLabelTxt.set(self.traductions['nxny'][lang] + '  ')
         self.interpMethodLabelTxt.set(self.traductions['interpMethod'][lang] + '  ')
@@ -194,8 +848,21 @@ class AppTopoGui(tk.Frame):
         self.userLabelTxt.set(self.traductions['userDefined'][lang])
         self.convexHullLabelTxt.set(self.traductions['convexHull'][lang])
         self.gradientLabelTxt.set(self.traductions['gradient'][lang] + '  ')
+        self.shadingLabelTxt.set(self.traductions['shading'][lang] + '  ')
+        self.elevationLabelTxt.set(self.traductions['elevation'][lang])
+        self.hillshadeLabelTxt.set(self.traductions['hillshade'][lang])
+        self.slopeLabelTxt.set(self.traductions['slope'][lang])
+        self.aspectLabelTxt.set(self.traductions['aspect'][lang])
+        self.paperLabelTxt.set(self.traductions['paper'][lang] + '  ')
+        self.overlapLabelTxt.set(self.traductions['overlap'][lang] + '  ')
         self.drawButtonLabelTxt.set(self.traductions['drawButton'][lang])
         self.saveButtonLabelTxt.set(self.traductions['saveButton'][lang])
+        self.atlasButtonLabelTxt.set(self.traductions['atlasButton'][lang])
+        self.volumeButtonLabelTxt.set(self.traductions['volumeButton'][lang])
+        self.volumeSurveyTxt.set(self.traductions['volumeSurvey'][lang])
+        self.volumeSurveyTitleTxt.set(self.traductions['volumeSurveyTitle'][lang])
+        self.volumeResultTxt.set(self.traductions['volumeResult'][lang])
+        self.volumeResultTitleTxt.set(self.traductions['volumeResultTitle'][lang])
         self.quitButtonLabelTxt.set(self.traductions['quitButton'][lang])
         self.languageTxt.set(self.traductions['language'][lang])
         
@@ -214,6 +881,14 @@ class AppTopoGui(tk.Frame):
         self.err_draw_no_data_title.set(self.traductions['err_draw_no_data_title'][lang])
         self.err_input_file.set(self.traductions['err_input_file'][lang])
         self.err_input_file_title.set(self.traductions['err_input_file_title'][lang])
+        self.err_atlas.set(self.traductions['err_atlas'][lang])
+        self.err_atlas_title.set(self.traductions['err_atlas_title'][lang])
+        self.err_volume_no_map.set(self.traductions['err_volume_no_map'][lang])
+        self.err_volume_no_map_title.set(self.traductions['err_volume_no_map_title'][lang])
+        self.err_save_data.set(self.traductions['err_save_data'][lang])
+        self.err_save_data_title.set(self.traductions['err_save_data_title'][lang])
+        self.err_save_data_open.set(self.traductions['err_save_data_open'][lang])
+        self.err_save_data_open_title.set(self.traductions['err_save_data_open_title'][lang])
         
         # refresh the interface
         self.update()
@@ -244,7 +919,11 @@ class AppTopoGui(tk.Frame):
         
         # ... creation load button
         self.loadButton = tk.Button(self, textvariable=self.loadButtonLabelTxt, command=self.load_file)
-        self.loadButton.grid(column=0, row=0, columnspan=4, sticky='E'+'W')
+        self.loadButton.grid(column=0, row=0, columnspan=2, sticky='E'+'W')
+        
+        # ... creation binary save button
+        saveDataButton = tk.Button(self, textvariable=self.saveDataButtonLabelTxt, command=self.save_data)
+        saveDataButton.grid(column=2, row=0, columnspan=2, sticky='E'+'W')
                 
         # ... create label for scale
         scaleLabel = tk.Label(self, textvariable=self.scaleLabelTxt, anchor="center")
@@ -308,75 +987,125 @@ class AppTopoGui(tk.Frame):
         self.delta_lEntry.grid(column=1, row=6, columnspan=3,sticky='E'+'W')
         self.delta_lEntryVariable.set("0.50")
         
+        # ... create label for the index contour lines
+        index_everyLabel = tk.Label(self, textvariable=self.index_everyLabelTxt, anchor="center")
+        index_everyLabel.grid(column=0, row=7, sticky='E')
+        
+        # ... create entry for the index contour lines
+        self.index_everyEntryVariable = tk.IntVar()
+        self.index_everyEntry = tk.Entry(self, textvariable=self.index_everyEntryVariable)
+        self.index_everyEntry.grid(column=1, row=7, columnspan=3,sticky='E'+'W')
+        self.index_everyEntryVariable.set("5")
+        
         # ... create label for extension
         extensionLabel = tk.Label(self, textvariable=self.extensionLabelTxt, anchor="center")
-        extensionLabel.grid(column=0, row=7, sticky='E')
+        extensionLabel.grid(column=0, row=8, sticky='E')
         
         # ... create entry for extension
         self.extensionEntryVariable = tk.IntVar()
         self.extensionEntry = tk.Entry(self, textvariable=self.extensionEntryVariable)
-        self.extensionEntry.grid(column=1, row=7, columnspan=3,sticky='E'+'W')
+        self.extensionEntry.grid(column=1, row=8, columnspan=3,sticky='E'+'W')
         self.extensionEntryVariable.set("2")
 
         # ... create label for nx x ny
         nxnyLabel = tk.Label(self, textvariable=self.nxnyLabelTxt, anchor="center")
-        nxnyLabel.grid(column=0, row=8, sticky='E')
+        nxnyLabel.grid(column=0, row=9, sticky='E')
         nxny2Label = tk.Label(self, text=" x ", anchor="center")
-        nxny2Label.grid(column=2, row=8, sticky='E'+'W')
+        nxny2Label.grid(column=2, row=9, sticky='E'+'W')
         
         # ... creating entry for nx
         self.nxEntryVariable = tk.IntVar()
         self.nxEntry = tk.Entry(self, textvariable=self.nxEntryVariable)
-        self.nxEntry.grid(column=1, row=8, columnspan=1,sticky='E'+'W')
+        self.nxEntry.grid(column=1, row=9, columnspan=1,sticky='E'+'W')
         self.nxEntryVariable.set("500")
         
         # ... creating entry for ny
         self.nyEntryVariable = tk.IntVar()
         self.nyEntry = tk.Entry(self, textvariable=self.nyEntryVariable)
-        self.nyEntry.grid(column=3, row=8, columnspan=1,sticky='E'+'W')
+        self.nyEntry.grid(column=3, row=9, columnspan=1,sticky='E'+'W')
         self.nyEntryVariable.set("500")
         
         # ... creating the label for the gradient coloring selection
         gradientLabel = tk.Label(self, textvariable=self.gradientLabelTxt, anchor="center")
-        gradientLabel.grid(column=0, row=9, sticky='E')
+        gradientLabel.grid(column=0, row=10, sticky='E')
         
         # ... creating the radio buttons for selection the gradient coloring
         self.gradientVariable = tk.IntVar()
-        tk.Radiobutton(self, textvariable=self.yesLabelTxt, padx=20, variable=self.gradientVariable, value=1).grid(column=1, row=9, sticky='W')
-        tk.Radiobutton(self, textvariable=self.noLabelTxt, padx=20, variable=self.gradientVariable, value=0).grid(column=2, row=9, sticky='W')
+        tk.Radiobutton(self, textvariable=self.yesLabelTxt, padx=20, variable=self.gradientVariable, value=1).grid(column=1, row=10, sticky='W')
+        tk.Radiobutton(self, textvariable=self.noLabelTxt, padx=20, variable=self.gradientVariable, value=0).grid(column=2, row=10, sticky='W')
         self.gradientVariable.set(1)
         
+        # ... creating the label for the shading used as gradient
+        shadingLabel = tk.Label(self, textvariable=self.shadingLabelTxt, anchor="center")
+        shadingLabel.grid(column=0, row=11, sticky='E')
+        
+        # ... creating the radio buttons for selecting the shading
+        self.shadingVariable = tk.StringVar()
+        tk.Radiobutton(self, textvariable=self.elevationLabelTxt, padx=20, variable=self.shadingVariable, value="elevation").grid(column=1, row=11, sticky='W')
+        tk.Radiobutton(self, textvariable=self.hillshadeLabelTxt, padx=20, variable=self.shadingVariable, value="hillshade").grid(column=2, row=11, sticky='W')
+        tk.Radiobutton(self, textvariable=self.slopeLabelTxt,     padx=20, variable=self.shadingVariable, value="slope").grid(column=3, row=11, sticky='W')
+        tk.Radiobutton(self, textvariable=self.aspectLabelTxt,    padx=20, variable=self.shadingVariable, value="aspect").grid(column=1, row=12, sticky='W')
+        self.shadingVariable.set("elevation")
+        
         # ... creating the label for the interpolation method
         interpMethodLabel = tk.Label(self, textvariable=self.interpMethodLabelTxt, anchor="center")
-        interpMethodLabel.grid(column=0, row=10, sticky='E')
+        interpMethodLabel.grid(column=0, row=13, sticky='E')
         
         # ... creating the radio buttons for selecting the interpolation method
         self.interpMethodVariable = tk.StringVar()
-        tk.Radiobutton(self, textvariable=self.linearLabelTxt, padx=20, variable=self.interpMethodVariable, value="linear").grid(column=1 ,row=10, sticky='W')
-        tk.Radiobutton(self, textvariable=self.cubicLabelTxt,  padx=20, variable=self.interpMethodVariable, value="cubic" ).grid(column=2, row=10, columnspan=2,sticky='W')
+        tk.Radiobutton(self, textvariable=self.linearLabelTxt, padx=20, variable=self.interpMethodVariable, value="linear").grid(column=1 ,row=13, sticky='W')
+        tk.Radiobutton(self, textvariable=self.cubicLabelTxt,  padx=20, variable=self.interpMethodVariable, value="cubic" ).grid(column=2, row=13, columnspan=2,sticky='W')
         self.interpMethodVariable.set("cubic")
         
         # ... creating the label for the building points sorting method
         buildingSortMethodLabel = tk.Label(self, textvariable=self.buildingSortMethodLabelTxt, anchor="center")
-        buildingSortMethodLabel.grid(column=0, row=11, sticky='E')
+        buildingSortMethodLabel.grid(column=0, row=14, sticky='E')
         
         # ... creating the radio buttons for selecting the method to sort the buildings' points
         self.buildingSortMethodVariable = tk.StringVar()
-        tk.Radiobutton(self, textvariable=self.userLabelTxt,       padx=20, variable=self.buildingSortMethodVariable, value="user").grid(column=1, row=11, sticky='W')
-        tk.Radiobutton(self, textvariable=self.convexHullLabelTxt, padx=20, variable=self.buildingSortMethodVariable, value="convex_hull").grid(column=2, columnspan=2, sticky='W', row=11)
+        tk.Radiobutton(self, textvariable=self.userLabelTxt,       padx=20, variable=self.buildingSortMethodVariable, value="user").grid(column=1, row=14, sticky='W')
+        tk.Radiobutton(self, textvariable=self.convexHullLabelTxt, padx=20, variable=self.buildingSortMethodVariable, value="convex_hull").grid(column=2, columnspan=2, sticky='W', row=14)
         self.buildingSortMethodVariable.set("user")
         
+        # ... creating the label for the atlas paper format
+        paperLabel = tk.Label(self, textvariable=self.paperLabelTxt, anchor="center")
+        paperLabel.grid(column=0, row=15, sticky='E')
+        
+        # ... creating the radio buttons for selecting the atlas paper format
+        self.paperVariable = tk.StringVar()
+        tk.Radiobutton(self, text="A3", padx=20, variable=self.paperVariable, value="A3").grid(column=1, row=15, sticky='W')
+        tk.Radiobutton(self, text="A1", padx=20, variable=self.paperVariable, value="A1").grid(column=2, row=15, sticky='W')
+        self.paperVariable.set("A3")
+        
+        # ... create label for the overlap between the atlas sheets
+        overlapLabel = tk.Label(self, textvariable=self.overlapLabelTxt, anchor="center")
+        overlapLabel.grid(column=0, row=16, sticky='E')
+        
+        # ... create entry for the overlap between the atlas sheets
+        self.overlapEntryVariable = tk.DoubleVar()
+        self.overlapEntry = tk.Entry(self, textvariable=self.overlapEntryVariable)
+        self.overlapEntry.grid(column=1, row=16, columnspan=3,sticky='E'+'W')
+        self.overlapEntryVariable.set("2")
+        
         # ... creating draw button
         drawButton = tk.Button(self, textvariable=self.drawButtonLabelTxt, command=self.draw_map)
-        drawButton.grid(column=0, row=12, columnspan=4, sticky='E'+'W')
+        drawButton.grid(column=0, row=17, columnspan=4, sticky='E'+'W')
                 
         # ... creating save button
         saveButton = tk.Button(self, textvariable=self.saveButtonLabelTxt, command=self.save_map)
-        saveButton.grid(column=0,row=13,columnspan=4,sticky='E'+'W')        
+        saveButton.grid(column=0,row=18,columnspan=4,sticky='E'+'W')        
+        
+        # ... creating atlas button
+        atlasButton = tk.Button(self, textvariable=self.atlasButtonLabelTxt, command=self.save_atlas)
+        atlasButton.grid(column=0,row=19,columnspan=4,sticky='E'+'W')
+        
+        # ... creating volumes button
+        volumeButton = tk.Button(self, textvariable=self.volumeButtonLabelTxt, command=self.compute_volumes)
+        volumeButton.grid(column=0,row=20,columnspan=4,sticky='E'+'W')
         
         # ... creating bouton quit
         quitButton = tk.Button(self, textvariable=self.quitButtonLabelTxt,command=self.quit_app)
-        quitButton.grid(column=0,row=14,columnspan=4,sticky='E'+'W')
+        quitButton.grid(column=0,row=21,columnspan=4,sticky='E'+'W')
                 
         # prevent resizing of the interface
         self.parent.resizable(False, False)
@@ -399,17 +1128,25 @@ class AppTopoGui(tk.Frame):
     ## clearing the data
     def clear_data(self):
         
-        self.listid.clear()
-        self.listx.clear()
-        self.listy.clear()
-        self.listz.clear()
-        self.bat.clear()
+        # the data read from a binary file are (memory-mapped) arrays, they are released and not cleared
+        self.listid = []
+        self.listx  = []
+        self.listy  = []
+        self.listz  = []
+        self.bat    = dict()
+        self.grid_cache.clear()
+        self.label_cache.clear()
+        self.map_data  = None
+        self.map_style = None
     
     ## loading a map
     def load_file(self):
         
         # getting input file name and path
-        self.csvfilename = askopenfilename();
+        options = {}
+        options['filetypes'] = [('all files', '*'), ('text files', '.txt .csv'), ('LAS files', '.las'),
+                                ('NumPy files', '.npy .npz'), ('TopoPy binary files', '.tpb')]
+        self.csvfilename = askopenfilename(**options);
         if(self.csvfilename == ''):
             return None
         
@@ -419,31 +1156,49 @@ class AppTopoGui(tk.Frame):
         self.clear_data()
         
         # reading file
-        with open(self.csvfilename,'r') as csvfile:
-            filereader = csv.reader(csvfile, delimiter = "\t",quotechar = " ")
-            for row in filereader:
-                try:
-                    if isFloat(row[3]):
-                        self.listid.append(str(row[0]))
-                        self.listx.append(float(row[1]))
-                        self.listy.append(float(row[2]))
-                        self.listz.append(float(row[3]))
-                    else:
-                        print("Reading a batiment point!")                        
-                        if row[3] not in self.bat:
-                            self.bat[row[3]] = list()
-                        self.bat[row[3]].append( [float(row[1]), float(row[2])] )
-                    
-                except:
-                    self.clear_data()
-                    print('Error while reading input file... maybe something wrong with it?')
-                    tk.messagebox.showerror(parent=self, title=self.err_input_file_title.get(), message = self.err_input_file.get())
-                    return None
+        try:
+            self.listid, self.listx, self.listy, self.listz, self.bat = read_survey(self.csvfilename)
+        except:
+            self.clear_data()
+            print('Error while reading input file... maybe something wrong with it?')
+            tk.messagebox.showerror(parent=self, title=self.err_input_file_title.get(), message = self.err_input_file.get())
+            return None
+    
+    ## saving the loaded data in the TopoPy binary format, read faster than the text format
+    def save_data(self):
+        
+        if len(self.listz) == 0:
+            print("No data loaded!")
+            tk.messagebox.showinfo(parent=self, title=self.err_draw_no_data_title.get(), message=self.err_draw_no_data.get())
+            return None
+        
+        options = {}
+        options['filetypes'] = [('TopoPy binary files', '.tpb')]
+        options['initialfile'] = os.path.splitext(os.path.basename(self.csvfilename))[0] + '.tpb'
+        save_filename = asksaveasfilename(**options)
+        if not save_filename:
+            print('No filename given... abort saving!')
+            return None
+        else:
+            print(save_filename)
+        
+        # the loaded survey may be memory-mapped from this file
+        if os.path.normcase(os.path.abspath(save_filename)) == os.path.normcase(os.path.abspath(self.csvfilename)):
+            print('Error: Could not overwrite the loaded file', save_filename)
+            tk.messagebox.showerror(parent=self, title=self.err_save_data_open_title.get(), message = self.err_save_data_open.get())
+            return None
+        
+        try:
+            write_columnar(save_filename, self.listid, self.listx, self.listy, self.listz, self.bat)
+        except IOError:
+            print('Error: Could not write the data in', save_filename)
+            tk.messagebox.showerror(parent=self, title=self.err_save_data_title.get(), message = self.err_save_data.get())
+            return None
     
     ## drawing the current map
     def draw_map(self):
         
-        if not self.listid:
+        if len(self.listz) == 0:
             print("No data loaded!")
             tk.messagebox.showinfo(parent=self, title=self.err_draw_no_data_title.get(), message=self.err_draw_no_data.get())
             return None
@@ -456,6 +1211,9 @@ class AppTopoGui(tk.Frame):
             ny        = self.nyEntryVariable.get()
             delta_l   = self.delta_lEntryVariable.get()
             base_l    = self.base_lEntryVariable.get()
+            index_every = self.index_everyEntryVariable.get()
+            if index_every < 1:
+                raise ValueError('The index contour lines interval must be positive')
         except:
             print('Error while reading the parameters given by the user!')
             tk.messagebox.showerror(parent=self, title=self.err_draw_param_title.get(), message = self.err_draw_param.get())
@@ -463,36 +1221,46 @@ class AppTopoGui(tk.Frame):
         
         ## plotting data
 
-        xmin = min(self.listx)
-        ymin = min(self.listy)
-        xmax = max(self.listx)
-        ymax = max(self.listy)
-        zmin = min(self.listz)
-        zmax = max(self.listz)
+        xmin = np.min(self.listx)
+        ymin = np.min(self.listy)
+        xmax = np.max(self.listx)
+        ymax = np.max(self.listy)
+        zmin = np.min(self.listz)
+        zmax = np.max(self.listz)
        
         # creating a new figure
         plt.figure()
 
-        # interpolation
-        xi = np.linspace(xmin, xmax, nx)
-        yi = np.linspace(ymin, ymax, ny)
-        X,Y = np.meshgrid(xi,yi)        
-        zi = griddata((self.listx, self.listy), self.listz, (X, Y), method=self.interpMethodVariable.get())        
+        # interpolation (only once for a given grid, the redraws reuse it; only the last grid is kept)
+        method = self.interpMethodVariable.get()
+        if (nx, ny, method) not in self.grid_cache:
+            self.grid_cache.clear()
+            xi = np.linspace(xmin, xmax, nx)
+            yi = np.linspace(ymin, ymax, ny)
+            zi = interpolate_grid(self.listx, self.listy, self.listz, xi, yi, method)
+            self.grid_cache[(nx, ny, method)] = (xi, yi, zi)
+        xi, yi, zi = self.grid_cache[(nx, ny, method)]
         
         # determining the location of the contour lines        
         lev_low = list(frange(base_l,zmin,-delta_l))
         lev_up  = list(frange(base_l+delta_l,zmax,delta_l))
+        levels  = sorted(lev_low + lev_up)
+        label_levels = index_levels(levels, base_l, delta_l, index_every)
         
-        # plotting of the result
-        C = plt.contour(xi, yi, zi, lev_low + lev_up, linewidths = 0.5, colors = 'k')
+        # plotting of the result (index contour lines thicker)
+        linewidths = [1.0 if l in label_levels else 0.5 for l in levels]
+        C = plt.contour(xi, yi, zi, levels, linewidths = linewidths, colors = 'k')
+        contours = flatten_contours(C)      # before the labels break the lines
         
         # adding a color
+        shading = self.shadingVariable.get()
+        vmin = vmax = None
         if self.gradientVariable.get() == 1:
-            plt.imshow(zi, extent=(xmin,xmax,ymin,ymax), origin='lower')
+            img, cmap = relief_image(shading, xi, yi, zi)
+            vmin = np.nanmin(img)
+            vmax = np.nanmax(img)
+            plt.imshow(img, extent=(xmin,xmax,ymin,ymax), origin='lower', cmap=cmap)
         
-        # adding labels to contour lines
-        plt.clabel(C, inline=1, fontsize=fnt_size);
-             
         # legend
         plt.colorbar()
         
@@ -500,18 +1268,21 @@ class AppTopoGui(tk.Frame):
         plt.scatter(self.listx, self.listy, marker = 'o', c = 'b', s = 5, zorder = 10)
         
         # plotting the building by determining their convex hull or using the order defined by the user in the data
+        polygons = list()
         for b, list_coord in self.bat.items():
             print("INFO: plotting building", b)
             
             ax = plt.subplot()
             if self.buildingSortMethodVariable.get() == "user":
                 ax.add_patch(Polygon(list_coord, closed = True, fill= False, hatch='///'))
+                polygons.append(list_coord)
             else:
                 hull = ConvexHull(np.asarray(list_coord))
                 list_coord_hull = list()
                 for v in hull.vertices:
                     list_coord_hull.append(list_coord[v])                
                 ax.add_patch(Polygon(list_coord_hull, closed = True, fill= False, hatch='///'))
+                polygons.append(list_coord_hull)
                                        
         # plot axis settings
         plt.axis('equal')
@@ -521,6 +1292,17 @@ class AppTopoGui(tk.Frame):
         self.ylim_max = ymax + extension
         plt.xlim(self.xlim_min, self.xlim_max)
         plt.ylim(self.ylim_min, self.ylim_max)
+        
+        # adding labels to the index contour lines, their positions are kept between the redraws
+        # the positions depend on the map scale, hence on the extension and the figure size
+        fig  = plt.gcf()
+        bbox = plt.gca().get_window_extent().transformed(fig.dpi_scale_trans.inverted())
+        m_per_inch = max((self.xlim_max - self.xlim_min) / bbox.width, (self.ylim_max - self.ylim_min) / bbox.height)
+        label_key = (nx, ny, method, tuple(label_levels), fnt_size, round(m_per_inch, 6))
+        if label_key not in self.label_cache:
+            self.label_cache.clear()
+            self.label_cache[label_key] = contour_label_positions(C, label_levels, fnt_size, m_per_inch)
+        add_contour_labels(C, self.label_cache[label_key], fnt_size)
 
         # x label
         # scale = self.scaleEntryVariable.get()
@@ -532,6 +1314,18 @@ class AppTopoGui(tk.Frame):
             for label, x, y in zip(labels, self.listx, self.listy):
                 plt.annotate(label, xy = (x, y), xytext = (-1, 1), textcoords = 'offset points', ha = 'right', va = 'bottom', size = fnt_size)
         
+        # keeping the grid and the geometry for the atlas export and the volumes
+        self.map_data = {'xi': xi, 'yi': yi, 'zi': zi, 'levels': levels,
+                         'index_levels': label_levels,
+                         'base_l': base_l, 'vmin': vmin, 'vmax': vmax, 'method': method,
+                         'x': np.asarray(self.listx), 'y': np.asarray(self.listy), 'ids': self.listid,
+                         'polygons': polygons,
+                         'xlim_min': self.xlim_min, 'xlim_max': self.xlim_max,
+                         'ylim_min': self.ylim_min, 'ylim_max': self.ylim_max}
+        self.map_data.update(contours)
+        self.map_style = {'fnt_size': fnt_size, 'plot_ids': self.plotId.get(), 'gradient': self.gradientVariable.get(),
+                          'shading': shading}
+        
         # showinf the final figure
         plt.show()
 
@@ -611,6 +1405,86 @@ class AppTopoGui(tk.Frame):
         plt.close()
         self.draw_map()
 
+    ## Saving the map as an atlas of sheets at the desired scale
+    def save_atlas(self):
+        
+        ## checking if a map has been drawn
+        
+        if self.map_data is None:
+            print('Warning: No map to save!')
+            tk.messagebox.showinfo(parent=self, title=self.err_save_no_map_title.get(), message=self.err_save_no_map.get())
+            return None
+        
+        ## checking user input
+        
+        try:
+            scale   = self.scaleEntryVariable.get()
+            dpi     = self.dpiEntryVariable.get()
+            overlap = self.overlapEntryVariable.get()
+            atlas_sheets(self.map_data['xlim_min'], self.map_data['xlim_max'], self.map_data['ylim_min'], self.map_data['ylim_max'],
+                         scale, self.paperVariable.get(), overlap)
+        except:
+            print('Error while reading the scale, dpi or overlap parameter given by the user!')
+            tk.messagebox.showerror(parent=self, title=self.err_atlas_title.get(), message = self.err_atlas.get())
+            return None
+        
+        ## determining output file name
+        
+        options = {}
+        # one png file per sheet is rendered in parallel, a pdf atlas on a single core
+        options['filetypes'] = [('png files', '.png'), ('pdf files', '.pdf')]
+        options['initialfile'] = 'atlas.png'
+        save_filename = asksaveasfilename(**options)
+        if not save_filename:
+            print('No filename given... abort saving!')
+            return None
+        else:
+            print(save_filename)
+        
+        ## rendering the sheets
+        
+        export_atlas(save_filename, self.map_data, self.map_style, scale, self.paperVariable.get(), overlap, dpi)
+
+    ## Computing the cut and fill volumes of the drawn map against another survey or the base altimetric level
+    def compute_volumes(self):
+        
+        ## checking if a map has been drawn (its grid is reused)
+        
+        if self.map_data is None:
+            print('Warning: No map drawn!')
+            tk.messagebox.showinfo(parent=self, title=self.err_volume_no_map_title.get(), message=self.err_volume_no_map.get())
+            return None
+        
+        xi = self.map_data['xi']
+        yi = self.map_data['yi']
+        zi = self.map_data['zi']
+        
+        ## determining the reference surface
+        
+        ref = self.map_data['base_l']
+        if tk.messagebox.askyesno(parent=self, title=self.volumeSurveyTitleTxt.get(), message=self.volumeSurveyTxt.get()):
+            survey_filename = askopenfilename()
+            if not survey_filename:
+                return None
+            print(survey_filename)
+            
+            try:
+                listid, listx, listy, listz, bat = read_survey(survey_filename)
+            except:
+                print('Error while reading input file... maybe something wrong with it?')
+                tk.messagebox.showerror(parent=self, title=self.err_input_file_title.get(), message = self.err_input_file.get())
+                return None
+            
+            # the other survey is interpolated on the grid of the drawn map, with the same method
+            ref = interpolate_grid(listx, listy, listz, xi, yi, self.map_data['method'])
+        
+        ## computing the volumes
+        
+        cut, fill = cut_fill_volumes(xi, yi, zi, ref)
+        print('INFO: cut =', cut, 'm3, fill =', fill, 'm3')
+        tk.messagebox.showinfo(parent=self, title=self.volumeResultTitleTxt.get(),
+                               message=self.volumeResultTxt.get().format(cut, fill, cut - fill))
+
 ## Main function        
 def main():
     root = tk.Tk()
@@ -619,4 +1493,5 @@ def main():
     plt.close('all')
     
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     main()  
\ No newline at end of file